@@ -2,68 +2,129 @@
 import os
 import asyncio
 import signal
-import atexit
+from contextlib import AsyncExitStack
 from typing import Optional
 from dotenv import load_dotenv
 
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp import ClientSession
 from langchain.chat_models import init_chat_model
 from langgraph.prebuilt import create_react_agent
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
 load_dotenv()
 #MCP_SCRIPT = os.environ.get("AZURE_PG_MCP_PATH", os.path.abspath("./azure_postgresql_mcp.py"))
 MCP_SCRIPT = "/Users/Alok_Sharma/Documents/myrepo/azure-postgresql-mcp/src/azure_postgresql_mcp.py"
 DEPLOYMENT = os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-35-turbo")
+MCP_SERVER = "azure-postgresql-mcp"
+MCP_PING_TIMEOUT = 5.0
 
 _GLOBAL_MCP_CLIENT: Optional[MultiServerMCPClient] = None
+_GLOBAL_MCP_SESSION: Optional[ClientSession] = None
+_GLOBAL_GRAPH = None
+_GLOBAL_EXIT_STACK: Optional[AsyncExitStack] = None
+_GRAPH_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_GRAPH_LOCK: Optional[asyncio.Lock] = None
+
+def _graph_lock():
+    # The lock, graph and MCP client belong to the loop that created them;
+    # a new loop (another asyncio.run()) starts from fresh state.
+    global _GRAPH_LOOP, _GRAPH_LOCK, _GLOBAL_MCP_CLIENT, _GLOBAL_MCP_SESSION, _GLOBAL_GRAPH, _GLOBAL_EXIT_STACK
+    loop = asyncio.get_running_loop()
+    if _GRAPH_LOOP is not loop:
+        _GRAPH_LOOP = loop
+        _GRAPH_LOCK = asyncio.Lock()
+        _GLOBAL_MCP_CLIENT = None
+        _GLOBAL_MCP_SESSION = None
+        _GLOBAL_GRAPH = None
+        _GLOBAL_EXIT_STACK = None
+    return _GRAPH_LOCK
+
+async def _session_alive():
+    # A ping that fails or times out means the MCP subprocess has gone away.
+    if _GLOBAL_MCP_SESSION is None:
+        return False
+    try:
+        await asyncio.wait_for(_GLOBAL_MCP_SESSION.send_ping(), timeout=MCP_PING_TIMEOUT)
+        return True
+    except Exception:
+        return False
 
 async def _build_graph():
-    global _GLOBAL_MCP_CLIENT
+    global _GLOBAL_MCP_CLIENT, _GLOBAL_MCP_SESSION, _GLOBAL_EXIT_STACK
     llm = init_chat_model(f"azure_openai:{DEPLOYMENT}", azure_deployment=DEPLOYMENT)
-    _GLOBAL_MCP_CLIENT = MultiServerMCPClient({
-        "azure-postgresql-mcp": {
+    client = MultiServerMCPClient({
+        MCP_SERVER: {
             "command": "python",
             "args": [MCP_SCRIPT],
             "transport": "stdio",
         }
     })
-    tools = await _GLOBAL_MCP_CLIENT.get_tools()
+    # Keep one MCP session, and its stdio subprocess, open for the graph's
+    # lifetime; closing the stack ends the session and the subprocess.
+    # The stack must be closed from the task that built the graph.
+    stack = AsyncExitStack()
+    try:
+        session = await stack.enter_async_context(client.session(MCP_SERVER))
+        tools = await load_mcp_tools(session)
+    except BaseException:
+        await stack.aclose()
+        raise
     g = create_react_agent(llm, tools)
-    setattr(g, "_mcp_client", _GLOBAL_MCP_CLIENT)
+    setattr(g, "_mcp_client", client)
+    _GLOBAL_MCP_CLIENT = client
+    _GLOBAL_MCP_SESSION = session
+    _GLOBAL_EXIT_STACK = stack
     return g
 
 # -------- Export for langgraph dev --------
 # Must be a Graph or a (async) factory function returning a Graph.
+# The graph and its MCP client are built once per event loop and reused across
+# calls for as long as the MCP session answers a ping.
 async def graph():
-    return await _build_graph()
+    global _GLOBAL_GRAPH
+    async with _graph_lock():
+        if _GLOBAL_GRAPH is not None and not await _session_alive():
+            try:
+                await _shutdown()
+            except Exception:
+                pass  # The dead session may not close cleanly; its state is already dropped
+        if _GLOBAL_GRAPH is None or _GLOBAL_MCP_CLIENT is None:
+            _GLOBAL_GRAPH = await _build_graph()
+        return _GLOBAL_GRAPH
 
 # -------- Standalone runner (optional) --------
 async def _shutdown():
-    global _GLOBAL_MCP_CLIENT
-    if _GLOBAL_MCP_CLIENT is not None:
-        try:
-            await _GLOBAL_MCP_CLIENT.close()
-        finally:
-            _GLOBAL_MCP_CLIENT = None
+    global _GLOBAL_MCP_CLIENT, _GLOBAL_MCP_SESSION, _GLOBAL_GRAPH, _GLOBAL_EXIT_STACK
+    stack, _GLOBAL_EXIT_STACK = _GLOBAL_EXIT_STACK, None
+    _GLOBAL_MCP_CLIENT = None
+    _GLOBAL_MCP_SESSION = None
+    _GLOBAL_GRAPH = None
+    if stack is not None:
+        await stack.aclose()
 
-def _install_signal_handlers(loop):
+def _install_signal_handlers(loop, task):
+    # Cancel the main task so that its exit stack shuts down in the same task
     for sig in (signal.SIGINT, signal.SIGTERM):
         try:
-            loop.add_signal_handler(sig, lambda: asyncio.create_task(_shutdown()))
+            loop.add_signal_handler(sig, task.cancel)
         except NotImplementedError:
             pass
 
-atexit.register(lambda: asyncio.run(_shutdown()) if asyncio.get_event_loop_policy().get_event_loop().is_running() is False else None)
-
 async def _main():
-    g = await graph()
-    user_msg = "Using the Azure PostgreSQL MCP tools, list schemas; then run SELECT current_database();"
-    res = await g.ainvoke({"messages": [{"role": "user", "content": user_msg}]})
-    print("\n=== Agent Result ===")
-    print(res)
-    await _shutdown()
+    _install_signal_handlers(asyncio.get_running_loop(), asyncio.current_task())
+    async with AsyncExitStack() as stack:
+        stack.push_async_callback(_shutdown)
+        g = await graph()
+        user_msg = "Using the Azure PostgreSQL MCP tools, list schemas; then run SELECT current_database();"
+        res = await g.ainvoke({"messages": [{"role": "user", "content": user_msg}]})
+        print("\n=== Agent Result ===")
+        print(res)
 
 if __name__ == "__main__":
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    _install_signal_handlers(loop)
-    loop.run_until_complete(_main())
+    if uvloop is not None:
+        uvloop.install()
+    asyncio.run(_main())
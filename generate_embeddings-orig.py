@@ -14,10 +14,16 @@ Example:
 
 import pandas as pd
 import psycopg2
+from psycopg2.extras import execute_values
+from pgvector.psycopg2 import register_vector
 import numpy as np
 from sentence_transformers import SentenceTransformer
+import torch
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 import sys
+import os
+import hashlib
+import importlib.util
 import warnings
 import logging
 
@@ -27,27 +33,77 @@ logger = logging.getLogger(__name__)
 
 warnings.filterwarnings('ignore')
 
+TEXT_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Local cache of text embeddings keyed by a hash of the embedded text, kept in a
+# separate file per model, backend and dtype so their vectors never mix
+EMBEDDING_CACHE_PATH = 'emb_cache-{variant}.npz'
+
 def connect_to_db(connection_string):
     """Connect to PostgreSQL database"""
     try:
         conn = psycopg2.connect(connection_string)
+        register_vector(conn)  # Adapt NumPy arrays to pgvector values
         return conn
     except Exception as e:
         logger.error(f"Error connecting to database: {e}")
         sys.exit(1)
 
+def load_embedding_cache(path):
+    """Load cached text embeddings as a dict of content hash -> vector"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path) as data:
+            return {str(key): vector for key, vector in zip(data['keys'], data['vectors'])}
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable embedding cache {path}: {e}")
+        return {}
+
+def save_embedding_cache(cache, path):
+    """Persist cached text embeddings to a local .npz file"""
+    if not cache:
+        return
+    keys = np.array(list(cache.keys()), dtype='U32')
+    vectors = np.stack(list(cache.values())).astype(np.float32)
+    np.savez(path, keys=keys, vectors=vectors)
+
+def onnx_backend_available():
+    """Check whether the optional ONNX Runtime backend dependencies are installed"""
+    return all(
+        importlib.util.find_spec(name) is not None
+        for name in ('onnxruntime', 'optimum')
+    )
+
+def text_model_variant():
+    """Choose the device, backend and dtype for the text model"""
+    # Use the GPU in half precision when available
+    if torch.cuda.is_available():
+        return 'cuda', 'torch', 'fp16'
+    
+    # On CPU prefer the ONNX Runtime backend (sentence-transformers[onnx]),
+    # falling back to PyTorch when it is not installed
+    if onnx_backend_available():
+        return 'cpu', 'onnx', 'fp32'
+    return 'cpu', 'torch', 'fp32'
+
+def load_text_model(variant):
+    """Load the sentence transformer model for a (device, backend, dtype) variant"""
+    device, backend, dtype = variant
+    logger.info(f"Loading sentence transformer model on {device} with {backend} ({dtype})...")
+    if device == 'cpu':
+        torch.set_num_threads(os.cpu_count() or 1)
+    model = SentenceTransformer(TEXT_MODEL_NAME, device=device, backend=backend)
+    if dtype == 'fp16':
+        model = model.half()
+    return model
+
 def generate_movie_embeddings(conn):
     """Generate embeddings for movies based on title and genres"""
     logger.info("Generating movie embeddings...")
     
-    # Load sentence transformer model
-    logger.info("Loading sentence transformer model...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    cursor = conn.cursor()
-    
-    # Fetch movie data
-    cursor.execute("""
+    # Fetch movie data into a columnar DataFrame
+    movies_df = pd.read_sql("""
         SELECT movie_id, title, 
                genre_action, genre_adventure, genre_animation, genre_children,
                genre_comedy, genre_crime, genre_documentary, genre_drama,
@@ -56,10 +112,9 @@ def generate_movie_embeddings(conn):
                genre_war, genre_western
         FROM movies
         ORDER BY movie_id
-    """)
+    """, conn)
     
-    movies = cursor.fetchall()
-    logger.info(f"Processing {len(movies)} movies...")
+    logger.info(f"Processing {len(movies_df)} movies...")
     
     # Genre names for text representation
     genre_names = [
@@ -68,195 +123,177 @@ def generate_movie_embeddings(conn):
         'mystery', 'romance', 'sci-fi', 'thriller', 'war', 'western'
     ]
     
-    embeddings_generated = 0
+    movie_ids = movies_df['movie_id'].tolist()
+    
+    # Create genre matrix (one-hot encoding, 18 columns)
+    genre_cols = [c for c in movies_df.columns if c.startswith('genre_')]
+    genre_matrix = movies_df[genre_cols].to_numpy(dtype=np.float32)
+    
+    # Build genre text once per distinct genre combination (packed as a bitmask)
+    masks = (genre_matrix.astype(np.uint32) << np.arange(18, dtype=np.uint32)).sum(axis=1)
+    unique_masks, inverse = np.unique(masks, return_inverse=True)
+    genre_texts_table = [
+        ' '.join(genre_names[j] for j in range(18) if int(mask) & (1 << j)) or 'general'
+        for mask in unique_masks
+    ]
+    
+    # Combine title and genres for embedding
+    texts = [
+        f"{title} {genre_texts_table[idx]}"
+        for title, idx in zip(movies_df['title'].tolist(), inverse.ravel().tolist())
+    ]
+    
+    # Reuse cached text embeddings for movies whose text has not changed
+    variant = text_model_variant()
+    cache_path = EMBEDDING_CACHE_PATH.format(variant='-'.join((TEXT_MODEL_NAME,) + variant))
+    cache = load_embedding_cache(cache_path)
+    keys = [hashlib.blake2b(text.encode(), digest_size=16).hexdigest() for text in texts]
+    misses = [i for i, key in enumerate(keys) if key not in cache]
+    logger.info(f"Embedding cache: {len(texts) - len(misses)} hits, {len(misses)} misses")
     
-    for i, movie in enumerate(movies):
-        movie_id = movie[0]
-        title = movie[1]
-        genres = movie[2:]
+    if misses:
+        model = load_text_model(variant)
         
-        # Create genre text representation
-        active_genres = [genre_names[j] for j, is_active in enumerate(genres) if is_active]
-        genre_text = ' '.join(active_genres) if active_genres else 'general'
+        # Generate text embeddings for all uncached movies in a single batched call
+        text_emb = model.encode(
+            [texts[i] for i in misses],
+            batch_size=1024,
+            convert_to_numpy=True,
+            normalize_embeddings=False,
+            show_progress_bar=True,
+            device=variant[0]
+        ).reshape(len(misses), -1)
         
-        # Combine title and genres for embedding
-        text_for_embedding = f"{title} {genre_text}"
+        # Ensure text embeddings are exactly 110 dimensions
+        text_emb = np.pad(
+            text_emb[:, :110],
+            ((0, 0), (0, max(0, 110 - text_emb.shape[1])))
+        ).astype(np.float32)
         
-        try:
-            # Generate text embedding
-            text_embedding = model.encode(text_for_embedding)
-            
-            # Create genre vector (one-hot encoding)
-            genre_vector = np.array(genres, dtype=float)
-            
-            # Combine text and genre embeddings
-            # Ensure text embedding is exactly 110 dimensions
-            if len(text_embedding) > 110:
-                text_embedding = text_embedding[:110]
-            else:
-                text_embedding = np.pad(text_embedding, (0, 110 - len(text_embedding)))
-            
-            # Combine with 18-dimensional genre vector
-            combined_embedding = np.concatenate([text_embedding, genre_vector])
-            
-            # Ensure exactly 128 dimensions
-            if len(combined_embedding) > 128:
-                combined_embedding = combined_embedding[:128]
-            else:
-                combined_embedding = np.pad(combined_embedding, (0, 128 - len(combined_embedding)))
-            
-            # Normalize the embedding
-            embedding_norm = np.linalg.norm(combined_embedding)
-            if embedding_norm > 0:
-                combined_embedding = combined_embedding / embedding_norm
-            
-            # Update movie with embedding
-            cursor.execute("""
-                UPDATE movies SET embedding = %s WHERE movie_id = %s
-            """, (combined_embedding.tolist(), movie_id))
-            
-            embeddings_generated += 1
-            
-            if (i + 1) % 100 == 0:
-                logger.info(f"Processed {i + 1}/{len(movies)} movies...")
-                conn.commit()  # Commit periodically
-                
-        except Exception as e:
-            logger.error(f"Error processing movie {movie_id}: {e}")
-            continue
+        for i, vector in zip(misses, text_emb):
+            cache[keys[i]] = vector
+        save_embedding_cache(cache, cache_path)
+    
+    # Combine text and genre embeddings (110 + 18 = 128) in a single matrix
+    combined = np.empty((len(texts), 128), dtype=np.float32)
+    combined[:, :110] = np.stack([cache[key] for key in keys])
+    combined[:, 110:] = genre_matrix
+    
+    # Normalize all embeddings to unit length in one pass
+    combined /= np.linalg.norm(combined, axis=1, keepdims=True).clip(min=1e-12)
+    
+    # Update all movies with their embeddings in batched statements
+    cursor = conn.cursor()
+    rows = list(zip(movie_ids, combined))
+    execute_values(cursor, """
+        UPDATE movies SET embedding = data.emb
+        FROM (VALUES %s) AS data(id, emb)
+        WHERE movies.movie_id = data.id
+    """, rows, template="(%s, %s::vector)", page_size=1000)
     
     conn.commit()
     cursor.close()
-    logger.info(f"Generated embeddings for {embeddings_generated} movies")
+    logger.info(f"Generated embeddings for {len(rows)} movies")
 
 def generate_user_embeddings(conn):
     """Generate embeddings for users based on demographics and rating patterns"""
     logger.info("Generating user embeddings...")
     
-    cursor = conn.cursor()
-    
-    # Fetch user data with rating statistics
-    cursor.execute("""
+    # Fetch user data with rating statistics and genre preferences in one scan
+    logger.info("Computing rating statistics and genre preferences...")
+    users_df = pd.read_sql("""
+        WITH ur AS (
+            SELECT r.user_id, r.rating,
+                   m.genre_action, m.genre_adventure, m.genre_animation, m.genre_children,
+                   m.genre_comedy, m.genre_crime, m.genre_documentary, m.genre_drama,
+                   m.genre_fantasy, m.genre_film_noir, m.genre_horror, m.genre_musical,
+                   m.genre_mystery, m.genre_romance, m.genre_sci_fi, m.genre_thriller,
+                   m.genre_war, m.genre_western
+            FROM ratings r
+            JOIN movies m ON r.movie_id = m.movie_id
+        )
         SELECT u.user_id, u.age, u.gender, u.occupation,
-               COUNT(r.rating) as num_ratings,
-               AVG(r.rating::float) as avg_rating,
-               STDDEV(r.rating::float) as rating_stddev
+               COUNT(ur.rating) as num_ratings,
+               AVG(ur.rating::float) as avg_rating,
+               STDDEV(ur.rating::float) as rating_stddev,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_action) as action_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_adventure) as adventure_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_animation) as animation_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_children) as children_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_comedy) as comedy_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_crime) as crime_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_documentary) as documentary_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_drama) as drama_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_fantasy) as fantasy_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_film_noir) as film_noir_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_horror) as horror_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_musical) as musical_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_mystery) as mystery_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_romance) as romance_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_sci_fi) as sci_fi_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_thriller) as thriller_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_war) as war_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_western) as western_pref
         FROM users u
-        LEFT JOIN ratings r ON u.user_id = r.user_id
+        LEFT JOIN ur ON u.user_id = ur.user_id
         GROUP BY u.user_id, u.age, u.gender, u.occupation
         ORDER BY u.user_id
-    """)
-    
-    users = cursor.fetchall()
-    logger.info(f"Processing {len(users)} users...")
-    
-    # Get genre preferences for each user
-    logger.info("Computing genre preferences...")
-    cursor.execute("""
-        SELECT u.user_id,
-               AVG(CASE WHEN m.genre_action THEN r.rating ELSE NULL END) as action_pref,
-               AVG(CASE WHEN m.genre_adventure THEN r.rating ELSE NULL END) as adventure_pref,
-               AVG(CASE WHEN m.genre_animation THEN r.rating ELSE NULL END) as animation_pref,
-               AVG(CASE WHEN m.genre_children THEN r.rating ELSE NULL END) as children_pref,
-               AVG(CASE WHEN m.genre_comedy THEN r.rating ELSE NULL END) as comedy_pref,
-               AVG(CASE WHEN m.genre_crime THEN r.rating ELSE NULL END) as crime_pref,
-               AVG(CASE WHEN m.genre_documentary THEN r.rating ELSE NULL END) as documentary_pref,
-               AVG(CASE WHEN m.genre_drama THEN r.rating ELSE NULL END) as drama_pref,
-               AVG(CASE WHEN m.genre_fantasy THEN r.rating ELSE NULL END) as fantasy_pref,
-               AVG(CASE WHEN m.genre_film_noir THEN r.rating ELSE NULL END) as film_noir_pref,
-               AVG(CASE WHEN m.genre_horror THEN r.rating ELSE NULL END) as horror_pref,
-               AVG(CASE WHEN m.genre_musical THEN r.rating ELSE NULL END) as musical_pref,
-               AVG(CASE WHEN m.genre_mystery THEN r.rating ELSE NULL END) as mystery_pref,
-               AVG(CASE WHEN m.genre_romance THEN r.rating ELSE NULL END) as romance_pref,
-               AVG(CASE WHEN m.genre_sci_fi THEN r.rating ELSE NULL END) as sci_fi_pref,
-               AVG(CASE WHEN m.genre_thriller THEN r.rating ELSE NULL END) as thriller_pref,
-               AVG(CASE WHEN m.genre_war THEN r.rating ELSE NULL END) as war_pref,
-               AVG(CASE WHEN m.genre_western THEN r.rating ELSE NULL END) as western_pref
-        FROM users u
-        LEFT JOIN ratings r ON u.user_id = r.user_id
-        LEFT JOIN movies m ON r.movie_id = m.movie_id
-        GROUP BY u.user_id
-        ORDER BY u.user_id
-    """)
+    """, conn)
     
-    genre_prefs = cursor.fetchall()
-    genre_pref_dict = {row[0]: row[1:] for row in genre_prefs}
+    logger.info(f"Processing {len(users_df)} users...")
     
     # Prepare occupation encoding
-    occupations = list(set([user[3] for user in users if user[3]]))
+    occupations = list(set(users_df['occupation'].dropna()))
     occupation_encoder = LabelEncoder()
     occupation_encoder.fit(occupations)
+    occ_to_code = {
+        occ: code / len(occupations)
+        for code, occ in enumerate(occupation_encoder.classes_)
+    }
     
-    embeddings_generated = 0
+    # Handle None values
+    age = users_df['age'].astype(float)
+    num_ratings = users_df['num_ratings'].fillna(0).astype(float)
+    avg_rating = users_df['avg_rating'].fillna(2.5).astype(float)
+    rating_stddev = users_df['rating_stddev'].fillna(0).astype(float)
     
-    for i, user in enumerate(users):
-        user_id, age, gender, occupation, num_ratings, avg_rating, rating_stddev = user
-        
-        try:
-            # Handle None values
-            num_ratings = num_ratings or 0
-            avg_rating = avg_rating or 2.5
-            rating_stddev = rating_stddev or 0
-            
-            # Create demographic features
-            age_normalized = (age - 18) / (73 - 18) if age else 0.5  # Normalize age to 0-1
-            gender_encoded = 1.0 if gender == 'M' else 0.0
-            
-            # Encode occupation
-            occupation_encoded = 0
-            if occupation and occupation in occupations:
-                occupation_encoded = occupation_encoder.transform([occupation])[0] / len(occupations)
-            
-            # Rating behavior features
-            rating_features = np.array([
-                min(num_ratings / 100.0, 1.0),  # Normalize number of ratings (cap at 100)
-                (avg_rating - 1) / 4,           # Normalize average rating to 0-1
-                min(rating_stddev / 2.0, 1.0)   # Normalize rating standard deviation (cap at 2)
-            ])
-            
-            # Genre preferences (18 dimensions)
-            genre_pref_vector = np.array(genre_pref_dict.get(user_id, [None] * 18))
-            # Replace None with neutral rating (2.5) and normalize
-            genre_pref_vector = np.where(
-                pd.isna(genre_pref_vector), 
-                2.5, 
-                genre_pref_vector
-            ).astype(float)
-            genre_pref_vector = (genre_pref_vector - 1) / 4  # Normalize to 0-1
-            
-            # Combine all features
-            user_features = np.concatenate([
-                [age_normalized, gender_encoded, occupation_encoded],  # 3 dimensions
-                rating_features,                                       # 3 dimensions
-                genre_pref_vector                                      # 18 dimensions
-            ])  # Total: 24 dimensions
-            
-            # Pad to 128 dimensions
-            user_embedding = np.pad(user_features, (0, 128 - len(user_features)))
-            
-            # Normalize the embedding
-            embedding_norm = np.linalg.norm(user_embedding)
-            if embedding_norm > 0:
-                user_embedding = user_embedding / embedding_norm
-            
-            # Update user with embedding
-            cursor.execute("""
-                UPDATE users SET embedding = %s WHERE user_id = %s
-            """, (user_embedding.tolist(), user_id))
-            
-            embeddings_generated += 1
-            
-            if (i + 1) % 100 == 0:
-                logger.info(f"Processed {i + 1}/{len(users)} users...")
-                conn.commit()  # Commit periodically
-                
-        except Exception as e:
-            logger.error(f"Error processing user {user_id}: {e}")
-            continue
+    user_features = np.column_stack([
+        # Demographic features (3 dimensions)
+        np.where(age > 0, (age - 18) / (73 - 18), 0.5),     # Normalize age to 0-1
+        (users_df['gender'] == 'M').astype(float),
+        users_df['occupation'].map(occ_to_code).fillna(0.0).astype(float),
+        # Rating behavior features (3 dimensions)
+        np.minimum(num_ratings / 100.0, 1.0),               # Normalize number of ratings (cap at 100)
+        (avg_rating - 1) / 4,                               # Normalize average rating to 0-1
+        np.minimum(rating_stddev / 2.0, 1.0),               # Normalize rating standard deviation (cap at 2)
+    ]).astype(np.float32)
+    
+    # Genre preferences (18 dimensions), neutral rating (2.5) when unrated, normalized to 0-1
+    pref_cols = [c for c in users_df.columns if c.endswith('_pref')]
+    genre_pref_matrix = users_df[pref_cols].astype(float).fillna(2.5).to_numpy(dtype=np.float32)
+    genre_pref_matrix = (genre_pref_matrix - 1) / 4
+    
+    # Pad to 128 dimensions by writing the 24 features into a zeroed matrix
+    user_ids = users_df['user_id'].tolist()
+    user_embeddings = np.zeros((len(user_ids), 128), dtype=np.float32)
+    user_embeddings[:, :6] = user_features
+    user_embeddings[:, 6:24] = genre_pref_matrix
+    
+    # Normalize all embeddings to unit length in one pass
+    user_embeddings /= np.linalg.norm(user_embeddings, axis=1, keepdims=True).clip(min=1e-12)
+    
+    # Update all users with their embeddings in batched statements
+    cursor = conn.cursor()
+    rows = list(zip(user_ids, user_embeddings))
+    execute_values(cursor, """
+        UPDATE users SET embedding = data.emb
+        FROM (VALUES %s) AS data(id, emb)
+        WHERE users.user_id = data.id
+    """, rows, template="(%s, %s::vector)", page_size=1000)
     
     conn.commit()
     cursor.close()
-    logger.info(f"Generated embeddings for {embeddings_generated} users")
+    logger.info(f"Generated embeddings for {len(rows)} users")
 
 def verify_embeddings(conn):
     """Verify that embeddings have been generated correctly"""
@@ -269,7 +306,7 @@ def verify_embeddings(conn):
         SELECT 
             COUNT(*) as total_movies,
             COUNT(embedding) as movies_with_embeddings,
-            AVG(array_length(embedding, 1)) as avg_embedding_dim
+            AVG(vector_dims(embedding)) as avg_embedding_dim
         FROM movies
     """)
     movie_stats = cursor.fetchone()
@@ -279,7 +316,7 @@ def verify_embeddings(conn):
         SELECT 
             COUNT(*) as total_users,
             COUNT(embedding) as users_with_embeddings,
-            AVG(array_length(embedding, 1)) as avg_embedding_dim
+            AVG(vector_dims(embedding)) as avg_embedding_dim
         FROM users
     """)
     user_stats = cursor.fetchone()
@@ -289,7 +326,7 @@ def verify_embeddings(conn):
     
     # Sample embedding verification
     cursor.execute("""
-        SELECT movie_id, array_length(embedding, 1) as dim
+        SELECT movie_id, vector_dims(embedding) as dim
         FROM movies 
         WHERE embedding IS NOT NULL 
         LIMIT 3
@@ -298,7 +335,7 @@ def verify_embeddings(conn):
     logger.info(f"Sample movie embeddings: {movie_samples}")
     
     cursor.execute("""
-        SELECT user_id, array_length(embedding, 1) as dim
+        SELECT user_id, vector_dims(embedding) as dim
         FROM users 
         WHERE embedding IS NOT NULL 
         LIMIT 3
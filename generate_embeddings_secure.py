@@ -14,6 +14,8 @@ Example:
 
 import pandas as pd
 import psycopg2
+from psycopg2.extras import execute_values
+from pgvector.psycopg2 import register_vector
 import numpy as np
 import sys
 import warnings
@@ -31,6 +33,7 @@ def connect_to_db(connection_string):
     """Connect to PostgreSQL database"""
     try:
         conn = psycopg2.connect(connection_string)
+        register_vector(conn)  # Adapt NumPy arrays to pgvector values
         return conn
     except Exception as e:
         logger.error(f"Error connecting to database: {e}")
@@ -111,7 +114,7 @@ def generate_movie_embeddings(conn):
         'mystery', 'romance', 'sci-fi', 'thriller', 'war', 'western'
     ]
     
-    embeddings_generated = 0
+    rows = []
     
     for i, movie in enumerate(movies):
         movie_id = movie[0]
@@ -156,24 +159,26 @@ def generate_movie_embeddings(conn):
             # Normalize the embedding
             combined_embedding = normalize_vector(combined_embedding)
             
-            # Update movie with embedding
-            cursor.execute("""
-                UPDATE movies SET embedding = %s WHERE movie_id = %s
-            """, (combined_embedding.tolist(), movie_id))
-            
-            embeddings_generated += 1
+            # Collect the embedding for the batched update below
+            rows.append((movie_id, combined_embedding.astype(np.float32)))
             
             if (i + 1) % 100 == 0:
                 logger.info(f"Processed {i + 1}/{len(movies)} movies...")
-                conn.commit()  # Commit periodically
                 
         except Exception as e:
             logger.error(f"Error processing movie {movie_id}: {e}")
             continue
     
+    # Update all movies with their embeddings in batched statements
+    execute_values(cursor, """
+        UPDATE movies SET embedding = data.emb
+        FROM (VALUES %s) AS data(id, emb)
+        WHERE movies.movie_id = data.id
+    """, rows, template="(%s, %s::vector)", page_size=1000)
+    
     conn.commit()
     cursor.close()
-    logger.info(f"Generated embeddings for {embeddings_generated} movies")
+    logger.info(f"Generated embeddings for {len(rows)} movies")
 
 def generate_user_embeddings(conn):
     """Generate embeddings for users based on demographics and rating patterns"""
@@ -181,14 +186,43 @@ def generate_user_embeddings(conn):
     
     cursor = conn.cursor()
     
-    # Fetch user data with rating statistics
+    # Fetch user data with rating statistics and genre preferences in one scan
+    logger.info("Computing rating statistics and genre preferences...")
     cursor.execute("""
+        WITH ur AS (
+            SELECT r.user_id, r.rating,
+                   m.genre_action, m.genre_adventure, m.genre_animation, m.genre_children,
+                   m.genre_comedy, m.genre_crime, m.genre_documentary, m.genre_drama,
+                   m.genre_fantasy, m.genre_film_noir, m.genre_horror, m.genre_musical,
+                   m.genre_mystery, m.genre_romance, m.genre_sci_fi, m.genre_thriller,
+                   m.genre_war, m.genre_western
+            FROM ratings r
+            JOIN movies m ON r.movie_id = m.movie_id
+        )
         SELECT u.user_id, u.age, u.gender, u.occupation,
-               COUNT(r.rating) as num_ratings,
-               AVG(r.rating::float) as avg_rating,
-               STDDEV(r.rating::float) as rating_stddev
+               COUNT(ur.rating) as num_ratings,
+               AVG(ur.rating::float) as avg_rating,
+               STDDEV(ur.rating::float) as rating_stddev,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_action) as action_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_adventure) as adventure_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_animation) as animation_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_children) as children_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_comedy) as comedy_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_crime) as crime_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_documentary) as documentary_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_drama) as drama_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_fantasy) as fantasy_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_film_noir) as film_noir_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_horror) as horror_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_musical) as musical_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_mystery) as mystery_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_romance) as romance_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_sci_fi) as sci_fi_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_thriller) as thriller_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_war) as war_pref,
+               AVG(ur.rating::float) FILTER (WHERE ur.genre_western) as western_pref
         FROM users u
-        LEFT JOIN ratings r ON u.user_id = r.user_id
+        LEFT JOIN ur ON u.user_id = ur.user_id
         GROUP BY u.user_id, u.age, u.gender, u.occupation
         ORDER BY u.user_id
     """)
@@ -196,46 +230,19 @@ def generate_user_embeddings(conn):
     users = cursor.fetchall()
     logger.info(f"Processing {len(users)} users...")
     
-    # Get genre preferences for each user
-    logger.info("Computing genre preferences...")
-    cursor.execute("""
-        SELECT u.user_id,
-               AVG(CASE WHEN m.genre_action THEN r.rating ELSE NULL END) as action_pref,
-               AVG(CASE WHEN m.genre_adventure THEN r.rating ELSE NULL END) as adventure_pref,
-               AVG(CASE WHEN m.genre_animation THEN r.rating ELSE NULL END) as animation_pref,
-               AVG(CASE WHEN m.genre_children THEN r.rating ELSE NULL END) as children_pref,
-               AVG(CASE WHEN m.genre_comedy THEN r.rating ELSE NULL END) as comedy_pref,
-               AVG(CASE WHEN m.genre_crime THEN r.rating ELSE NULL END) as crime_pref,
-               AVG(CASE WHEN m.genre_documentary THEN r.rating ELSE NULL END) as documentary_pref,
-               AVG(CASE WHEN m.genre_drama THEN r.rating ELSE NULL END) as drama_pref,
-               AVG(CASE WHEN m.genre_fantasy THEN r.rating ELSE NULL END) as fantasy_pref,
-               AVG(CASE WHEN m.genre_film_noir THEN r.rating ELSE NULL END) as film_noir_pref,
-               AVG(CASE WHEN m.genre_horror THEN r.rating ELSE NULL END) as horror_pref,
-               AVG(CASE WHEN m.genre_musical THEN r.rating ELSE NULL END) as musical_pref,
-               AVG(CASE WHEN m.genre_mystery THEN r.rating ELSE NULL END) as mystery_pref,
-               AVG(CASE WHEN m.genre_romance THEN r.rating ELSE NULL END) as romance_pref,
-               AVG(CASE WHEN m.genre_sci_fi THEN r.rating ELSE NULL END) as sci_fi_pref,
-               AVG(CASE WHEN m.genre_thriller THEN r.rating ELSE NULL END) as thriller_pref,
-               AVG(CASE WHEN m.genre_war THEN r.rating ELSE NULL END) as war_pref,
-               AVG(CASE WHEN m.genre_western THEN r.rating ELSE NULL END) as western_pref
-        FROM users u
-        LEFT JOIN ratings r ON u.user_id = r.user_id
-        LEFT JOIN movies m ON r.movie_id = m.movie_id
-        GROUP BY u.user_id
-        ORDER BY u.user_id
-    """)
-    
-    genre_prefs = cursor.fetchall()
-    genre_pref_dict = {row[0]: row[1:] for row in genre_prefs}
+    # Genre preferences as a dense matrix aligned with users, with a neutral
+    # rating (2.5) when unrated, normalized to 0-1 in one pass
+    pref_values = np.array([user[7:] for user in users], dtype=np.float32).reshape(-1, 18)
+    genre_pref_matrix = (np.where(np.isnan(pref_values), 2.5, pref_values) - 1) / 4
     
     # Prepare occupation encoding manually
     occupations = list(set([user[3] for user in users if user[3]]))
     occupation_to_idx = {occ: idx for idx, occ in enumerate(occupations)}
     
-    embeddings_generated = 0
+    rows = []
     
     for i, user in enumerate(users):
-        user_id, age, gender, occupation, num_ratings, avg_rating, rating_stddev = user
+        user_id, age, gender, occupation, num_ratings, avg_rating, rating_stddev = user[:7]
         
         try:
             # Handle None values
@@ -260,14 +267,7 @@ def generate_user_embeddings(conn):
             ])
             
             # Genre preferences (18 dimensions)
-            genre_pref_vector = np.array(genre_pref_dict.get(user_id, [None] * 18))
-            # Replace None with neutral rating (2.5) and normalize
-            genre_pref_vector = np.where(
-                pd.isna(genre_pref_vector), 
-                2.5, 
-                genre_pref_vector
-            ).astype(float)
-            genre_pref_vector = (genre_pref_vector - 1) / 4  # Normalize to 0-1
+            genre_pref_vector = genre_pref_matrix[i]
             
             # Combine all features
             user_features = np.concatenate([
@@ -282,24 +282,26 @@ def generate_user_embeddings(conn):
             # Normalize the embedding
             user_embedding = normalize_vector(user_embedding)
             
-            # Update user with embedding
-            cursor.execute("""
-                UPDATE users SET embedding = %s WHERE user_id = %s
-            """, (user_embedding.tolist(), user_id))
-            
-            embeddings_generated += 1
+            # Collect the embedding for the batched update below
+            rows.append((user_id, user_embedding.astype(np.float32)))
             
             if (i + 1) % 100 == 0:
                 logger.info(f"Processed {i + 1}/{len(users)} users...")
-                conn.commit()  # Commit periodically
                 
         except Exception as e:
             logger.error(f"Error processing user {user_id}: {e}")
             continue
     
+    # Update all users with their embeddings in batched statements
+    execute_values(cursor, """
+        UPDATE users SET embedding = data.emb
+        FROM (VALUES %s) AS data(id, emb)
+        WHERE users.user_id = data.id
+    """, rows, template="(%s, %s::vector)", page_size=1000)
+    
     conn.commit()
     cursor.close()
-    logger.info(f"Generated embeddings for {embeddings_generated} users")
+    logger.info(f"Generated embeddings for {len(rows)} users")
 
 def verify_embeddings(conn):
     """Verify that embeddings have been generated correctly"""
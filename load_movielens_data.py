@@ -12,22 +12,62 @@ Example:
     python load_movielens_data.py "host=localhost dbname=movielens_demo user=postgres"
 """
 
+import asyncio
+from urllib.parse import quote, urlencode
 import pandas as pd
-import psycopg2
-from datetime import datetime
+import asyncpg
+from psycopg2.extensions import parse_dsn
 import sys
 import os
 
-def connect_to_db(connection_string):
-    """Connect to PostgreSQL database"""
+# libpq parameters that asyncpg understands in a connection URI query string;
+# any other key would be sent to the server as a setting
+ASYNCPG_DSN_KEYS = {
+    'host', 'port', 'user', 'password', 'passfile',
+    'sslmode', 'sslcert', 'sslkey', 'sslrootcert', 'sslcrl', 'sslpassword',
+    'ssl_min_protocol_version', 'ssl_max_protocol_version',
+    'target_session_attrs', 'krbsrvname', 'gsslib'
+}
+
+def connection_dsn(connection_string):
+    """Convert a libpq key=value connection string into a URI asyncpg accepts"""
+    if connection_string.startswith(('postgresql://', 'postgres://')):
+        return connection_string
+    
+    params = parse_dsn(connection_string)
+    
+    # asyncpg takes the database from the URI path, not from a dbname query key
+    dbname = params.pop('dbname', '')
+    
+    unsupported = sorted(set(params) - ASYNCPG_DSN_KEYS)
+    if unsupported:
+        raise ValueError(f"Connection parameters not supported by asyncpg: {', '.join(unsupported)}")
+    
+    return f"postgresql:///{quote(dbname, safe='')}?{urlencode(params)}"
+
+async def connect_to_db(connection_string, pool_size=3):
+    """Create a pool of PostgreSQL database connections"""
     try:
-        conn = psycopg2.connect(connection_string)
-        return conn
+        pool = await asyncpg.create_pool(
+            dsn=connection_dsn(connection_string), min_size=1, max_size=pool_size
+        )
+        return pool
     except Exception as e:
         print(f"Error connecting to database: {e}")
         sys.exit(1)
 
-def load_users_data(conn, filepath):
+async def run_loader(pool, loader, filepath):
+    """Run a loader on its own pooled connection"""
+    async with pool.acquire() as conn:
+        await loader(conn, filepath)
+
+def dataframe_records(df, columns):
+    """Convert DataFrame columns into tuples of native Python values for COPY"""
+    frame = df[columns].astype(object)
+    frame = frame.where(frame.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
+
+async def load_users_data(conn, filepath):
     """Load users data from u.user file"""
     print("Loading users data...")
     
@@ -35,33 +75,26 @@ def load_users_data(conn, filepath):
         print(f"Error: File {filepath} not found")
         return
     
-    # Read the users file
-    users_df = pd.read_csv(
-        filepath,
-        sep='|',
-        names=['user_id', 'age', 'gender', 'occupation', 'zip_code'],
-        encoding='latin-1'
-    )
-    
-    print(f"Read {len(users_df)} users from file")
+    columns = ['user_id', 'age', 'gender', 'occupation', 'zip_code']
     
-    # Insert data into users table
-    cursor = conn.cursor()
-    
-    # Clear existing data
-    cursor.execute("DELETE FROM users")
-    
-    for _, row in users_df.iterrows():
-        cursor.execute("""
-            INSERT INTO users (user_id, age, gender, occupation, zip_code)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (int(row['user_id']), int(row['age']), str(row['gender']), str(row['occupation']), str(row['zip_code'])))
-    
-    conn.commit()
-    cursor.close()
-    print(f"Loaded {len(users_df)} users into database")
+    async with conn.transaction():
+        # Clear existing data
+        await conn.execute("DELETE FROM users")
+        
+        # Stream the users file straight into COPY
+        with open(filepath, 'rb') as f:
+            status = await conn.copy_to_table(
+                'users',
+                source=f,
+                columns=columns,
+                format='csv',
+                delimiter='|',
+                encoding='latin-1'
+            )
+    
+    print(f"Loaded {status.split()[-1]} users into database")
 
-def load_movies_data(conn, filepath):
+async def load_movies_data(conn, filepath):
     """Load movies data from u.item file"""
     print("Loading movies data...")
     
@@ -90,43 +123,35 @@ def load_movies_data(conn, filepath):
         'mystery', 'romance', 'sci_fi', 'thriller', 'war', 'western'
     ]
     
-    cursor = conn.cursor()
-    
-    # Clear existing data
-    cursor.execute("DELETE FROM movies")
-    
-    for _, row in movies_df.iterrows():
-        # Parse release date
-        release_date = None
-        if pd.notna(row['release_date']) and row['release_date']:
-            try:
-                release_date = datetime.strptime(row['release_date'], '%d-%b-%Y').date()
-            except ValueError:
-                # Try alternative date format
-                try:
-                    release_date = datetime.strptime(row['release_date'], '%Y').date()
-                except ValueError:
-                    release_date = None
-        
-        # Prepare genre boolean values (exclude 'unknown' genre at index 18)
-        genre_values = [bool(row[f'genre_{i}']) for i in range(18)]
+    # Parse release dates, falling back to a bare year format
+    release_dates = pd.to_datetime(movies_df['release_date'], format='%d-%b-%Y', errors='coerce')
+    release_dates = release_dates.fillna(
+        pd.to_datetime(movies_df['release_date'], format='%Y', errors='coerce')
+    )
+    movies_df['release_date'] = release_dates.dt.date
+    movies_df['title'] = movies_df['title'].astype(str)
+    
+    # Prepare genre boolean values (exclude 'unknown' genre at index 18)
+    genre_columns = [f'genre_{i}' for i in range(18)]
+    movies_df[genre_columns] = movies_df[genre_columns].astype(bool)
+    
+    async with conn.transaction():
+        # Clear existing data
+        await conn.execute("DELETE FROM movies")
         
-        cursor.execute("""
-            INSERT INTO movies (
-                movie_id, title, release_date, imdb_url,
-                genre_action, genre_adventure, genre_animation, genre_children,
-                genre_comedy, genre_crime, genre_documentary, genre_drama,
-                genre_fantasy, genre_film_noir, genre_horror, genre_musical,
-                genre_mystery, genre_romance, genre_sci_fi, genre_thriller,
-                genre_war, genre_western
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, [int(row['movie_id']), str(row['title']), release_date, str(row['imdb_url'])] + genre_values)
-    
-    conn.commit()
-    cursor.close()
+        # Stream all movies through binary COPY in one round-trip
+        await conn.copy_records_to_table(
+            'movies',
+            records=dataframe_records(
+                movies_df, ['movie_id', 'title', 'release_date', 'imdb_url'] + genre_columns
+            ),
+            columns=['movie_id', 'title', 'release_date', 'imdb_url'] +
+                    [f'genre_{name}' for name in genre_names]
+        )
+    
     print(f"Loaded {len(movies_df)} movies into database")
 
-def load_ratings_data(conn, filepath):
+async def load_ratings_data(conn, filepath):
     """Load ratings data from u.data file"""
     print("Loading ratings data...")
     
@@ -134,77 +159,48 @@ def load_ratings_data(conn, filepath):
         print(f"Error: File {filepath} not found")
         return
     
-    # Read the ratings file
-    ratings_df = pd.read_csv(
-        filepath,
-        sep='\t',
-        names=['user_id', 'movie_id', 'rating', 'timestamp']
-    )
-    
-    print(f"Read {len(ratings_df)} ratings from file")
-    
-    cursor = conn.cursor()
+    columns = ['user_id', 'movie_id', 'rating', 'timestamp']
     
-    # Clear existing data
-    cursor.execute("DELETE FROM ratings")
-    
-    # Insert in batches for better performance
-    batch_size = 1000
-    for i in range(0, len(ratings_df), batch_size):
-        batch = ratings_df.iloc[i:i+batch_size]
-        
-        # Prepare batch insert
-        values = []
-        for _, row in batch.iterrows():
-            values.append((int(row['user_id']), int(row['movie_id']), int(row['rating']), int(row['timestamp'])))
+    async with conn.transaction():
+        # Clear existing data
+        await conn.execute("DELETE FROM ratings")
         
-        # Execute batch insert
-        cursor.executemany("""
-            INSERT INTO ratings (user_id, movie_id, rating, timestamp)
-            VALUES (%s, %s, %s, %s)
-        """, values)
-        
-        if (i + batch_size) % 10000 == 0:
-            print(f"Loaded {i + batch_size} ratings...")
-    
-    conn.commit()
-    cursor.close()
-    print(f"Loaded {len(ratings_df)} ratings into database")
+        # Stream the tab-separated ratings file straight into COPY
+        with open(filepath, 'rb') as f:
+            status = await conn.copy_to_table(
+                'ratings',
+                source=f,
+                columns=columns,
+                format='text'
+            )
+    
+    print(f"Loaded {status.split()[-1]} ratings into database")
 
-def verify_data_load(conn):
+async def verify_data_load(conn):
     """Verify that data has been loaded correctly"""
     print("\nVerifying data load...")
     
-    cursor = conn.cursor()
-    
     # Check record counts
-    cursor.execute("SELECT COUNT(*) FROM users")
-    user_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM movies")
-    movie_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM ratings")
-    rating_count = cursor.fetchone()[0]
+    user_count = await conn.fetchval("SELECT COUNT(*) FROM users")
+    movie_count = await conn.fetchval("SELECT COUNT(*) FROM movies")
+    rating_count = await conn.fetchval("SELECT COUNT(*) FROM ratings")
     
     print(f"Users: {user_count}")
     print(f"Movies: {movie_count}")
     print(f"Ratings: {rating_count}")
     
     # Check for referential integrity
-    cursor.execute("""
+    orphaned_user_ratings = await conn.fetchval("""
         SELECT COUNT(*) FROM ratings r
         LEFT JOIN users u ON r.user_id = u.user_id
         WHERE u.user_id IS NULL
     """)
-    orphaned_user_ratings = cursor.fetchone()[0]
     
-    cursor.execute("""
+    orphaned_movie_ratings = await conn.fetchval("""
         SELECT COUNT(*) FROM ratings r
         LEFT JOIN movies m ON r.movie_id = m.movie_id
         WHERE m.movie_id IS NULL
     """)
-    orphaned_movie_ratings = cursor.fetchone()[0]
     
     if orphaned_user_ratings > 0:
         print(f"Warning: {orphaned_user_ratings} ratings reference non-existent users")
@@ -217,19 +213,48 @@ def verify_data_load(conn):
     
     # Sample data
     print("\nSample data:")
-    cursor.execute("SELECT * FROM users LIMIT 3")
-    users_sample = cursor.fetchall()
-    print("Users sample:", users_sample)
+    users_sample = await conn.fetch("SELECT * FROM users LIMIT 3")
+    print("Users sample:", [tuple(row) for row in users_sample])
     
-    cursor.execute("SELECT movie_id, title FROM movies LIMIT 3")
-    movies_sample = cursor.fetchall()
-    print("Movies sample:", movies_sample)
+    movies_sample = await conn.fetch("SELECT movie_id, title FROM movies LIMIT 3")
+    print("Movies sample:", [tuple(row) for row in movies_sample])
     
-    cursor.execute("SELECT * FROM ratings LIMIT 3")
-    ratings_sample = cursor.fetchall()
-    print("Ratings sample:", ratings_sample)
+    ratings_sample = await conn.fetch("SELECT * FROM ratings LIMIT 3")
+    print("Ratings sample:", [tuple(row) for row in ratings_sample])
+
+async def load_all(connection_string, data_files):
+    """Load all MovieLens data files and verify the result"""
+    # Connect to database
+    pool = await connect_to_db(connection_string)
     
-    cursor.close()
+    try:
+        # Clear ratings up front so the users and movies loaders do not
+        # contend on the same rows through ON DELETE CASCADE
+        await pool.execute("DELETE FROM ratings")
+        
+        # Users and movies are independent and load concurrently;
+        # ratings reference both so they load afterwards
+        await asyncio.gather(
+            run_loader(pool, load_users_data, data_files['users']),
+            run_loader(pool, load_movies_data, data_files['movies'])
+        )
+        await run_loader(pool, load_ratings_data, data_files['ratings'])
+        
+        # Verify the data load
+        async with pool.acquire() as conn:
+            await verify_data_load(conn)
+        
+        print("\n✓ Data loading completed successfully!")
+        print("\nNext steps:")
+        print("1. Run generate_embeddings.py to create vector embeddings")
+        print("2. Create DiskANN indexes on the embedding columns")
+        print("3. Set up Apache AGE graph with the loaded data")
+        
+    except Exception as e:
+        print(f"Error during data loading: {e}")
+        raise
+    finally:
+        await pool.close()
 
 def main():
     if len(sys.argv) != 2:
@@ -259,31 +284,7 @@ def main():
         print("Download from: https://files.grouplens.org/datasets/movielens/ml-100k.zip")
         sys.exit(1)
     
-    # Connect to database
-    conn = connect_to_db(connection_string)
-    
-    try:
-        # Load data in order (users and movies first, then ratings)
-        load_users_data(conn, data_files['users'])
-        load_movies_data(conn, data_files['movies'])
-        load_ratings_data(conn, data_files['ratings'])
-        
-        # Verify the data load
-        verify_data_load(conn)
-        
-        print("\n✓ Data loading completed successfully!")
-        print("\nNext steps:")
-        print("1. Run generate_embeddings.py to create vector embeddings")
-        print("2. Create DiskANN indexes on the embedding columns")
-        print("3. Set up Apache AGE graph with the loaded data")
-        
-    except Exception as e:
-        print(f"Error during data loading: {e}")
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+    asyncio.run(load_all(connection_string, data_files))
 
 if __name__ == "__main__":
     main()
-
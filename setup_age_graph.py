@@ -6,390 +6,523 @@ This script sets up the Apache AGE graph database with MovieLens data,
 creating nodes for users and movies, and relationships for ratings.
 
 Usage:
-    python setup_age_graph.py <connection_string>
+    python setup_age_graph.py <connection_string> [--skip-existing]
+
+    --skip-existing  keep an existing graph and only create the nodes and
+                     relationships whose counts do not match the source tables
 
 Example:
     python setup_age_graph.py "host=localhost dbname=movielens_demo user=postgres"
 """
 
 import psycopg2
+import numpy as np
+from psycopg2.extras import execute_batch, Json
+from psycopg2.pool import ThreadedConnectionPool
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import sys
 import logging
-import json
 from typing import List, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Cypher templates for creating User and Movie nodes from a batch of rows
+USER_CYPHER = """
+    UNWIND $rows AS r
+    CREATE (u:User {
+        user_id: r.user_id,
+        age: r.age,
+        gender: r.gender,
+        occupation: r.occupation,
+        zip_code: r.zip_code
+    })
+"""
+
+MOVIE_CYPHER = """
+    UNWIND $rows AS r
+    CREATE (m:Movie {
+        movie_id: r.movie_id,
+        title: r.title,
+        release_year: r.release_year,
+        genres: r.genres
+    })
+"""
+
+# Cypher template for creating RATED relationships from a batch of ratings
+RATED_CYPHER = """
+    UNWIND $rows AS r
+    MATCH (u:User), (m:Movie)
+    WHERE u.user_id = r.user_id AND m.movie_id = r.movie_id
+    CREATE (u)-[:RATED {
+        rating: r.rating,
+        timestamp: r.timestamp
+    }]->(m)
+    RETURN count(*)
+"""
+
+# Session-local function feeding ratings to RATED_CYPHER in batches of batch_size
+# and returning the number of edges created; its static statement is planned
+# once and the plan reused for every batch
+BULK_RATED_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION pg_temp.bulk_create_ratings(batch_size integer)
+RETURNS bigint
+LANGUAGE plpgsql
+AS $fn$
+DECLARE
+    batch RECORD;
+    params ag_catalog.agtype;
+    batch_created ag_catalog.agtype;
+    created_count bigint := 0;
+BEGIN
+    FOR batch IN
+        SELECT json_build_object('rows', json_agg(json_build_object(
+                   'user_id', user_id,
+                   'movie_id', movie_id,
+                   'rating', rating,
+                   'timestamp', timestamp
+               )))::text AS rows_json
+        FROM (
+            SELECT (row_number() OVER () - 1) / batch_size AS batch_no,
+                   user_id, movie_id, rating, timestamp
+            FROM public.ratings
+        ) AS numbered
+        GROUP BY batch_no
+    LOOP
+        params := batch.rows_json;
+        SELECT result INTO batch_created
+        FROM ag_catalog.cypher('movielens', $$
+            {RATED_CYPHER}
+        $$, params) as (result ag_catalog.agtype);
+        created_count := created_count + batch_created::text::bigint;
+    END LOOP;
+    
+    RETURN created_count;
+END
+$fn$;
+"""
+
 def connect_to_db(connection_string: str):
     """Connect to PostgreSQL database"""
     try:
         conn = psycopg2.connect(connection_string)
-        conn.autocommit = True  # Required for AGE operations
+        conn.autocommit = True  # Required for AGE graph DDL; bulk loads disable it
         return conn
     except Exception as e:
         logger.error(f"Error connecting to database: {e}")
         sys.exit(1)
 
-def setup_age_environment(conn):
+def setup_age_session(cursor):
+    """Load AGE and set the search path for the current session"""
+    # Load AGE extension
+    cursor.execute("LOAD 'age';")
+    
+    # Set search path
+    cursor.execute("SET search_path = ag_catalog, \"$user\", public;")
+
+class AGEConnectionPool(ThreadedConnectionPool):
+    """Thread-safe connection pool whose connections load AGE once when opened"""
+    
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        with conn.cursor() as cursor:
+            setup_age_session(cursor)
+        conn.commit()
+        return conn
+
+def run_in_age_session(pool, create):
+    """Run a graph loading step on its own pooled connection with AGE loaded"""
+    conn = pool.getconn()
+    
+    try:
+        with conn.cursor() as cursor:
+            create(cursor)
+        conn.commit()
+    finally:
+        pool.putconn(conn)
+
+def setup_age_environment(cursor, skip_existing=False):
     """Set up Apache AGE environment"""
     logger.info("Setting up Apache AGE environment...")
     
-    cursor = conn.cursor()
-    
     try:
-        # Load AGE extension
-        cursor.execute("LOAD 'age';")
-        
-        # Set search path
-        cursor.execute("SET search_path = ag_catalog, \"$user\", public;")
-        
-        # Check if graph already exists
-        cursor.execute("SELECT * FROM ag_catalog.ag_graph WHERE name = 'movielens';")
-        existing_graph = cursor.fetchone()
-        
-        if existing_graph:
-            logger.info("Graph 'movielens' already exists. Dropping and recreating...")
-            cursor.execute("SELECT ag_catalog.drop_graph('movielens', true);")
-        
-        # Create the graph
-        cursor.execute("SELECT ag_catalog.create_graph('movielens');")
-        logger.info("Created graph 'movielens'")
+        setup_age_session(cursor)
+        
+        if skip_existing:
+            # Keep an existing graph; create it only if it is missing
+            cursor.execute("""
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM ag_catalog.ag_graph WHERE name = 'movielens') THEN
+                        PERFORM ag_catalog.create_graph('movielens');
+                    END IF;
+                END
+                $$;
+            """)
+            logger.info("Graph 'movielens' is ready; existing data will be kept")
+        else:
+            # Drop any existing graph and create it again in one round-trip
+            cursor.execute("""
+                DO $$
+                BEGIN
+                    IF EXISTS (SELECT 1 FROM ag_catalog.ag_graph WHERE name = 'movielens') THEN
+                        PERFORM ag_catalog.drop_graph('movielens', true);
+                    END IF;
+                    PERFORM ag_catalog.create_graph('movielens');
+                END
+                $$;
+            """)
+            logger.info("Created graph 'movielens'")
         
     except Exception as e:
         logger.error(f"Error setting up AGE environment: {e}")
         raise
-    finally:
-        cursor.close()
 
-def create_user_nodes(conn):
+def graph_is_loaded(cursor, label, pattern, table):
+    """Return True when the graph already holds one match of pattern per row of table.
+    A partially loaded label is cleared so that it can be created again."""
+    cursor.execute(f"""
+        SELECT (SELECT count(*) FROM {table}), graph_count
+        FROM ag_catalog.cypher('movielens', $$
+            MATCH {pattern}
+            RETURN count(n)
+        $$) as (graph_count agtype);
+    """)
+    expected_count, graph_count = cursor.fetchone()
+    graph_count = int(str(graph_count))
+    
+    if graph_count == expected_count:
+        logger.info(f"Found all {graph_count} {label} in the graph, skipping")
+        return True
+    
+    if graph_count:
+        logger.info(f"Found {graph_count} of {expected_count} {label}, clearing them")
+        cursor.execute(f"""
+            SELECT * FROM ag_catalog.cypher('movielens', $$
+                MATCH {pattern}
+                DETACH DELETE n
+            $$) as (result agtype);
+        """)
+    
+    return False
+
+def prepare_cypher(cursor, name, cypher_query):
+    """Prepare a Cypher statement that takes its parameters as a single agtype map"""
+    cursor.execute(f"""
+        PREPARE {name}(agtype) AS
+        SELECT * FROM ag_catalog.cypher('movielens', $$
+            {cypher_query}
+        $$, $1) as (result agtype);
+    """)
+
+def fetch_batches(source, batch_size):
+    """Yield lists of up to batch_size rows from a cursor until it is exhausted"""
+    # Iterating the cursor fetches itersize rows per round-trip
+    rows_iter = iter(source)
+    while True:
+        rows = list(islice(rows_iter, batch_size))
+        if not rows:
+            break
+        yield rows
+
+def execute_cypher_batches(cursor, name, batches, page_size=10, commit_every=10):
+    """Execute a prepared Cypher statement once per batch of rows bound as $rows,
+    sending page_size EXECUTE statements per round-trip and committing every
+    commit_every batches. Returns the row count."""
+    sql = f"EXECUTE {name}(%s);"
+    row_count = 0
+    pending = []
+    
+    for rows in batches:
+        row_count += len(rows)
+        pending.append((Json({'rows': rows}),))
+        
+        if len(pending) == commit_every:
+            execute_batch(cursor, sql, pending, page_size=page_size)
+            cursor.connection.commit()
+            pending = []
+    
+    if pending:
+        execute_batch(cursor, sql, pending, page_size=page_size)
+        cursor.connection.commit()
+    
+    return row_count
+
+def create_user_nodes(cursor):
     """Create User nodes in the graph"""
     logger.info("Creating User nodes...")
     
-    cursor = conn.cursor()
-    
     try:
-        # Fetch user data
-        cursor.execute("""
-            SELECT user_id, age, gender, occupation, zip_code
-            FROM users
-            ORDER BY user_id
-        """)
-        users = cursor.fetchall()
-        
-        logger.info(f"Creating {len(users)} User nodes...")
-        
-        # Create User nodes in batches
-        batch_size = 100
-        created_count = 0
-        
-        for i in range(0, len(users), batch_size):
-            batch = users[i:i+batch_size]
-            
-            for user in batch:
-                user_id, age, gender, occupation, zip_code = user
-                
-                # Escape quotes in string values
-                occupation_safe = occupation.replace("'", "''") if occupation else ''
-                zip_code_safe = zip_code.replace("'", "''") if zip_code else ''
-                gender_safe = gender.replace("'", "''") if gender else ''
-                
-                cypher_query = f"""
-                SELECT * FROM ag_catalog.cypher('movielens', $$
-                    CREATE (u:User {{
-                        user_id: {user_id},
-                        age: {age},
-                        gender: '{gender_safe}',
-                        occupation: '{occupation_safe}',
-                        zip_code: '{zip_code_safe}'
-                    }})
-                $$) as (result agtype);
-                """
-                
-                cursor.execute(cypher_query)
-                created_count += 1
+        prepare_cypher(cursor, 'create_users', USER_CYPHER)
+        
+        # Stream user data through a server-side cursor
+        with cursor.connection.cursor(name='users_stream', withhold=True) as source:
+            source.itersize = 10000
+            source.execute("""
+                SELECT user_id, age, gender, occupation, zip_code
+                FROM users
+            """)
             
-            if (i + batch_size) % 500 == 0:
-                logger.info(f"Created {min(i + batch_size, len(users))} User nodes...")
-        
+            # Create User nodes in batches
+            batch_size = 1000
+            batches = (
+                [
+                    {
+                        'user_id': user_id,
+                        'age': age,
+                        'gender': gender or '',
+                        'occupation': occupation or '',
+                        'zip_code': zip_code or ''
+                    }
+                    for user_id, age, gender, occupation, zip_code in rows
+                ]
+                for rows in fetch_batches(source, batch_size)
+            )
+            created_count = execute_cypher_batches(cursor, 'create_users', batches)
+        
+        cursor.execute("DEALLOCATE create_users;")
         logger.info(f"Successfully created {created_count} User nodes")
         
     except Exception as e:
         logger.error(f"Error creating User nodes: {e}")
         raise
-    finally:
-        cursor.close()
 
-def create_movie_nodes(conn):
+def create_movie_nodes(cursor):
     """Create Movie nodes in the graph"""
     logger.info("Creating Movie nodes...")
     
-    cursor = conn.cursor()
-    
     try:
-        # Fetch movie data
-        cursor.execute("""
-            SELECT movie_id, title, release_date,
-                   genre_action, genre_adventure, genre_animation, genre_children,
-                   genre_comedy, genre_crime, genre_documentary, genre_drama,
-                   genre_fantasy, genre_film_noir, genre_horror, genre_musical,
-                   genre_mystery, genre_romance, genre_sci_fi, genre_thriller,
-                   genre_war, genre_western
-            FROM movies
-            ORDER BY movie_id
-        """)
-        movies = cursor.fetchall()
-        
-        logger.info(f"Creating {len(movies)} Movie nodes...")
-        
         # Genre names for creating genre arrays
-        genre_names = [
+        genre_names = np.array([
             'action', 'adventure', 'animation', 'children', 'comedy', 'crime',
             'documentary', 'drama', 'fantasy', 'film_noir', 'horror', 'musical',
             'mystery', 'romance', 'sci_fi', 'thriller', 'war', 'western'
-        ]
+        ])
         
-        created_count = 0
+        prepare_cypher(cursor, 'create_movies', MOVIE_CYPHER)
         
-        for movie in movies:
-            movie_id = movie[0]
-            title = movie[1]
-            release_date = movie[2]
-            genres = movie[3:]  # Boolean values for each genre
-            
-            # Escape double quotes in title for Cypher
-            title_safe = title.replace('"', '\\"') if title else ''
-            
-            # Create genre list
-            active_genres = [genre_names[i] for i, is_active in enumerate(genres) if is_active]
-            genres_str = "', '".join(active_genres)
-            genres_array = f"['{genres_str}']" if active_genres else "[]"
-            
-            # Format release date
-            release_year = release_date.year if release_date else None
-            
-            cypher_query = f"""
-            SELECT * FROM ag_catalog.cypher('movielens', $$
-                CREATE (m:Movie {{
-                    movie_id: {movie_id},
-                    title: "{title_safe}",
-                    release_year: {release_year if release_year else 'null'},
-                    genres: {genres_array}
-                }})
-            $$) as (result agtype);
-            """
+        def movie_rows(movies):
+            # Select every movie's active genre names with one boolean matrix
+            genre_matrix = np.array([movie[3:] for movie in movies], dtype=bool)
             
-            cursor.execute(cypher_query)
-            created_count += 1
+            return [
+                {
+                    'movie_id': movie[0],
+                    'title': movie[1] or '',
+                    'release_year': movie[2].year if movie[2] else None,
+                    'genres': genre_names[active].tolist()
+                }
+                for movie, active in zip(movies, genre_matrix)
+            ]
+        
+        # Stream movie data through a server-side cursor
+        with cursor.connection.cursor(name='movies_stream', withhold=True) as source:
+            source.itersize = 10000
+            source.execute("""
+                SELECT movie_id, title, release_date,
+                       genre_action, genre_adventure, genre_animation, genre_children,
+                       genre_comedy, genre_crime, genre_documentary, genre_drama,
+                       genre_fantasy, genre_film_noir, genre_horror, genre_musical,
+                       genre_mystery, genre_romance, genre_sci_fi, genre_thriller,
+                       genre_war, genre_western
+                FROM movies
+            """)
             
-            if created_count % 100 == 0:
-                logger.info(f"Created {created_count} Movie nodes...")
-        
+            # Create Movie nodes in batches
+            batch_size = 1000
+            batches = (
+                movie_rows(rows)
+                for rows in fetch_batches(source, batch_size)
+            )
+            created_count = execute_cypher_batches(cursor, 'create_movies', batches)
+        
+        cursor.execute("DEALLOCATE create_movies;")
         logger.info(f"Successfully created {created_count} Movie nodes")
         
     except Exception as e:
         logger.error(f"Error creating Movie nodes: {e}")
         raise
-    finally:
-        cursor.close()
 
-def create_rating_relationships(conn):
+def create_rating_relationships(cursor, skip_existing=False):
     """Create RATED relationships between users and movies"""
     logger.info("Creating RATED relationships...")
     
-    cursor = conn.cursor()
-    
     try:
-        # Fetch ratings data
-        cursor.execute("""
-            SELECT user_id, movie_id, rating, timestamp
-            FROM ratings
-            ORDER BY user_id, movie_id
-        """)
-        ratings = cursor.fetchall()
+        if skip_existing and graph_is_loaded(cursor, 'RATED relationships', '()-[n:RATED]->()', 'ratings'):
+            return
         
-        logger.info(f"Creating {len(ratings)} RATED relationships...")
-        
-        # Create relationships in batches
-        batch_size = 1000
-        created_count = 0
-        
-        for i in range(0, len(ratings), batch_size):
-            batch = ratings[i:i+batch_size]
-            
-            for rating_data in batch:
-                user_id, movie_id, rating, timestamp = rating_data
-                
-                cypher_query = f"""
-                SELECT * FROM ag_catalog.cypher('movielens', $$
-                    MATCH (u:User {{user_id: {user_id}}}), (m:Movie {{movie_id: {movie_id}}})
-                    CREATE (u)-[:RATED {{
-                        rating: {rating},
-                        timestamp: {timestamp}
-                    }}]->(m)
-                $$) as (result agtype);
-                """
-                
-                cursor.execute(cypher_query)
-                created_count += 1
-            
-            if (i + batch_size) % 10000 == 0:
-                logger.info(f"Created {min(i + batch_size, len(ratings))} RATED relationships...")
+        # Create all relationships server-side in one call, batched by 1000
+        cursor.execute(BULK_RATED_FUNCTION_SQL)
+        cursor.execute("SELECT pg_temp.bulk_create_ratings(1000);")
+        created_count = cursor.fetchone()[0]
+        cursor.connection.commit()
         
         logger.info(f"Successfully created {created_count} RATED relationships")
         
     except Exception as e:
         logger.error(f"Error creating RATED relationships: {e}")
         raise
-    finally:
-        cursor.close()
 
-def verify_graph_creation(conn):
+def verify_graph_creation(cursor):
     """Verify that the graph has been created correctly"""
     logger.info("Verifying graph creation...")
     
-    cursor = conn.cursor()
-    
     try:
-        # Count nodes by type
+        # Count nodes by label and relationships by type in one round-trip
         cursor.execute("""
-            SELECT * FROM ag_catalog.cypher('movielens', $$
+            SELECT 'node' as kind, node_type, count
+            FROM ag_catalog.cypher('movielens', $$
                 MATCH (n) 
                 RETURN labels(n)[0] as node_type, count(n) as count
-            $$) as (node_type agtype, count agtype);
-        """)
-        node_counts = cursor.fetchall()
-        
-        logger.info("Node counts:")
-        for node_type, count in node_counts:
-            # Remove quotes from agtype values
-            node_type_clean = str(node_type).strip('"')
-            logger.info(f"  {node_type_clean}: {count}")
-        
-        # Count relationships
-        cursor.execute("""
-            SELECT * FROM ag_catalog.cypher('movielens', $$
+            $$) as (node_type agtype, count agtype)
+            UNION ALL
+            SELECT 'relationship' as kind, relationship_type, count
+            FROM ag_catalog.cypher('movielens', $$
                 MATCH ()-[r]->() 
                 RETURN type(r) as relationship_type, count(r) as count
             $$) as (relationship_type agtype, count agtype);
         """)
-        rel_counts = cursor.fetchall()
+        counts = cursor.fetchall()
         
-        logger.info("Relationship counts:")
-        for rel_type, count in rel_counts:
-            # Remove quotes from agtype values
-            rel_type_clean = str(rel_type).strip('"')
-            logger.info(f"  {rel_type_clean}: {count}")
+        for kind, heading in (('node', "Node counts:"), ('relationship', "Relationship counts:")):
+            logger.info(heading)
+            for row_kind, name, count in counts:
+                if row_kind == kind:
+                    # Remove quotes from agtype values
+                    name_clean = str(name).strip('"')
+                    logger.info(f"  {name_clean}: {count}")
         
         # Sample data verification
         logger.info("Sample data verification:")
         
-        # Sample user
+        # Sample users, movies and ratings in one round-trip. The three cypher()
+        # calls are cross-joined, so each must keep returning exactly one
+        # collect() row; a non-aggregating RETURN would multiply the results.
         cursor.execute("""
-            SELECT * FROM ag_catalog.cypher('movielens', $$
+            SELECT sample_users, sample_movies, sample_ratings
+            FROM ag_catalog.cypher('movielens', $$
                 MATCH (u:User) 
-                RETURN u.user_id, u.age, u.gender, u.occupation
-                LIMIT 3
-            $$) as (user_id agtype, age agtype, gender agtype, occupation agtype);
-        """)
-        sample_users = cursor.fetchall()
-        logger.info(f"Sample users: {sample_users}")
-        
-        # Sample movie
-        cursor.execute("""
-            SELECT * FROM ag_catalog.cypher('movielens', $$
+                WITH u LIMIT 3
+                RETURN collect([u.user_id, u.age, u.gender, u.occupation])
+            $$) as (sample_users agtype),
+            ag_catalog.cypher('movielens', $$
                 MATCH (m:Movie) 
-                RETURN m.movie_id, m.title, m.genres
-                LIMIT 3
-            $$) as (movie_id agtype, title agtype, genres agtype);
-        """)
-        sample_movies = cursor.fetchall()
-        logger.info(f"Sample movies: {sample_movies}")
-        
-        # Sample rating
-        cursor.execute("""
-            SELECT * FROM ag_catalog.cypher('movielens', $$
+                WITH m LIMIT 3
+                RETURN collect([m.movie_id, m.title, m.genres])
+            $$) as (sample_movies agtype),
+            ag_catalog.cypher('movielens', $$
                 MATCH (u:User)-[r:RATED]->(m:Movie) 
-                RETURN u.user_id, m.title, r.rating
-                LIMIT 3
-            $$) as (user_id agtype, movie_title agtype, rating agtype);
+                WITH u, r, m LIMIT 3
+                RETURN collect([u.user_id, m.title, r.rating])
+            $$) as (sample_ratings agtype);
         """)
-        sample_ratings = cursor.fetchall()
+        sample_users, sample_movies, sample_ratings = cursor.fetchone()
+        logger.info(f"Sample users: {sample_users}")
+        logger.info(f"Sample movies: {sample_movies}")
         logger.info(f"Sample ratings: {sample_ratings}")
         
     except Exception as e:
         logger.error(f"Error verifying graph: {e}")
         raise
-    finally:
-        cursor.close()
 
-def create_graph_indexes(conn):
+def create_graph_indexes(cursor):
     """Create indexes for better graph query performance"""
     logger.info("Creating graph indexes...")
     
-    cursor = conn.cursor()
-    
     try:
-        # Note: AGE index creation syntax may vary depending on version
-        # These are examples - adjust based on your AGE version
+        # Index the id properties on the User and Movie label tables so that
+        # the MATCH lookups made while creating RATED edges use index scans.
+        # AGE compiles u.user_id to the VARIADIC form of agtype_access_operator,
+        # so the index expressions must use that form to match.
         
         # Index on User.user_id
         cursor.execute("""
-            SELECT * FROM ag_catalog.cypher('movielens', $$
-                CREATE INDEX user_id_idx FOR (u:User) ON (u.user_id)
-            $$) as (result agtype);
+            CREATE INDEX IF NOT EXISTS user_id_idx ON movielens."User"
+            (ag_catalog.agtype_access_operator(VARIADIC ARRAY[properties, '"user_id"'::agtype]));
         """)
         
         # Index on Movie.movie_id
         cursor.execute("""
-            SELECT * FROM ag_catalog.cypher('movielens', $$
-                CREATE INDEX movie_id_idx FOR (m:Movie) ON (m.movie_id)
-            $$) as (result agtype);
+            CREATE INDEX IF NOT EXISTS movie_id_idx ON movielens."Movie"
+            (ag_catalog.agtype_access_operator(VARIADIC ARRAY[properties, '"movie_id"'::agtype]));
         """)
         
+        # Refresh planner statistics for the freshly loaded label tables
+        cursor.execute('ANALYZE movielens."User", movielens."Movie";')
+        cursor.connection.commit()
+        
         logger.info("Graph indexes created successfully")
         
     except Exception as e:
         # Index creation might fail in some AGE versions - this is not critical
+        cursor.connection.rollback()
         logger.warning(f"Index creation failed (this may be normal): {e}")
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python setup_age_graph.py <connection_string>")
+    args = [arg for arg in sys.argv[1:] if arg != '--skip-existing']
+    skip_existing = len(args) != len(sys.argv) - 1
+    
+    if len(args) != 1:
+        print("Usage: python setup_age_graph.py <connection_string> [--skip-existing]")
         print("Example: python setup_age_graph.py 'host=localhost dbname=movielens_demo user=postgres'")
         sys.exit(1)
     
-    connection_string = sys.argv[1]
+    connection_string = args[0]
     
     # Connect to database
     conn = connect_to_db(connection_string)
+    pool = None
+    
+    # Share one cursor across every step run on the main connection
+    cursor = conn.cursor()
     
     try:
         # Check if required tables exist
-        cursor = conn.cursor()
         cursor.execute("""
             SELECT table_name FROM information_schema.tables 
             WHERE table_schema = 'public' AND table_name IN ('users', 'movies', 'ratings')
         """)
         tables = [row[0] for row in cursor.fetchall()]
-        cursor.close()
         
         if len(tables) != 3:
             logger.error("Required tables (users, movies, ratings) not found. Please run load_movielens_data.py first.")
             sys.exit(1)
         
         # Set up AGE graph
-        setup_age_environment(conn)
-        create_user_nodes(conn)
-        create_movie_nodes(conn)
-        create_rating_relationships(conn)
-        
-        # Create indexes (optional)
-        create_graph_indexes(conn)
+        setup_age_environment(cursor, skip_existing)
+        
+        # Check for loaded nodes on the main connection, clearing any partial
+        # load before the concurrent workers start, so the workers only insert
+        node_loads = []
+        for label, pattern, table, create in (
+            ('User nodes', '(n:User)', 'users', create_user_nodes),
+            ('Movie nodes', '(n:Movie)', 'movies', create_movie_nodes)
+        ):
+            if not (skip_existing and graph_is_loaded(cursor, label, pattern, table)):
+                node_loads.append(create)
+        
+        # Users and movies are independent, so load them concurrently, each
+        # on its own session in explicit transactions committed per group of batches
+        if node_loads:
+            pool = AGEConnectionPool(1, len(node_loads), connection_string)
+            with ThreadPoolExecutor(max_workers=len(node_loads)) as executor:
+                futures = [executor.submit(run_in_age_session, pool, create) for create in node_loads]
+                for future in futures:
+                    future.result()
+        
+        conn.autocommit = False
+        
+        # Create indexes before the RATED edges, whose MATCH lookups use them
+        create_graph_indexes(cursor)
+        
+        create_rating_relationships(cursor, skip_existing)
+        conn.commit()
+        conn.autocommit = True
         
         # Verify creation
-        verify_graph_creation(conn)
+        verify_graph_creation(cursor)
         
         logger.info("✓ Apache AGE graph setup completed successfully!")
         logger.info("\nNext steps:")
@@ -401,6 +534,9 @@ def main():
         logger.error(f"Error during graph setup: {e}")
         raise
     finally:
+        if pool is not None:
+            pool.closeall()
+        cursor.close()
         conn.close()
 
 if __name__ == "__main__":